@@ -0,0 +1,179 @@
+""" addwitness.py
+Part of Witness Relationships v.0.1
+🄯 2022 Nicolas Vaughan
+n.vaughan@uniandes.edu.co
+Universidad de los Andes, Colombia
+Runs on Python 3.8+ """
+
+import os
+import sys
+from os import path
+from collections import Counter
+from difflib import SequenceMatcher
+
+try:
+    import defaults
+except ImportError:
+    raise ImportError("\n[!] defaults module not available.\nAborting...")
+
+try:
+    import getdata
+except ImportError:
+    raise ImportError("\n[!] getdata module not available.\nAborting...")
+
+try:
+    from witnesses import Witness
+except ImportError:
+    raise ImportError("\n[!] witnesses module not available.\nAborting...")
+
+try:
+    import createcollation
+except ImportError:
+    raise ImportError("\n[!] createcollation module not available.\nAborting...")
+
+# progress bars
+try:
+    from tqdm import tqdm
+except ImportError:
+    raise ImportError("\n[!] tqdm module not available.\nAborting...")
+
+
+# ------------------------------------------------------------------------------
+def consensus(segments: list) -> list:
+    """
+    Returns the consensus of the collated witnesses of a paragraph
+    (the most common reading of each segment) as a list of tuples
+    (token, segment index).
+    """
+    tokens = []
+    for s, segment in enumerate(segments):
+        readings = Counter(reading for reading in segment if reading != '---')
+        if readings:
+            reading = readings.most_common(1)[0][0]
+            tokens += [(token, s) for token in reading.split()]
+    return tokens
+
+
+# ------------------------------------------------------------------------------
+def align_paragraph(segments: list, text: str, column: int, width: int) -> list:
+    """
+    Aligns the text of a new witness against the collated segments
+    of a paragraph (through their consensus), and returns the segments
+    (of width witnesses) with the new witness' readings inserted
+    at the given column.
+    New words with no counterpart in the consensus become new segments,
+    in which the other witnesses read '---'.
+    """
+    constokens = consensus(segments)
+    contokens = [token for token, s in constokens]
+    newtokens = createcollation.tokenise(text)
+
+    # new tokens for each segment, and new segments before each segment
+    reading = [[] for _ in segments]
+    inserted = [[] for _ in range(len(segments) + 1)]
+
+    matcher = SequenceMatcher(None, contokens, newtokens, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in ('equal', 'replace'):
+            # map the new tokens on the consensus tokens, in order
+            for j in range(j1, j2):
+                i = i1 + min(j - j1, i2 - i1 - 1)
+                reading[constokens[i][1]].append(newtokens[j])
+        elif tag == 'insert':
+            if 0 < i1 < len(constokens) and constokens[i1 - 1][1] == constokens[i1][1]:
+                # inside a segment
+                reading[constokens[i1][1]] += newtokens[j1:j2]
+            else:
+                s = constokens[i1][1] if i1 < len(constokens) else len(segments)
+                inserted[s].append(" ".join(newtokens[j1:j2]))
+
+    out = []
+    for s in range(len(segments) + 1):
+        for words in inserted[s]:
+            row = ['---'] * width
+            row.insert(column, words)
+            out.append(row)
+        if s < len(segments):
+            row = list(segments[s])
+            row.insert(column, " ".join(reading[s]) or '---')
+            out.append(row)
+    return out
+
+
+# ------------------------------------------------------------------------------
+def addwitness(filelist: list, name: str) -> list:
+    """
+    Extends the stored collation ("{prefix}_variants.json") with
+    a new witness, whose file must be in the data directory, without
+    collating the other witnesses again: each of its paragraphs
+    is aligned once against the consensus of the collated ones.
+    Returns (and stores) the extended collation; the previous one
+    is kept as "{prefix}_{n}wit_variants.json" (and "_offsets.json"),
+    n being its No. of witnesses.
+    """
+    name = path.splitext(path.basename(name))[0]
+    if name not in filelist:
+        print(f"[!] Error! {name}.xml is not in {defaults.datadir}. Aborting...")
+        sys.exit(1)
+
+    fname = defaults.datadir + defaults.prefix + '_variants.json'
+    offsetsfname = defaults.datadir + defaults.prefix + '_offsets.json'
+    if not (path.exists(fname) and path.exists(offsetsfname)):
+        print(f"[!] Error! There is no collation to extend in {defaults.datadir}. Aborting...")
+        sys.exit(1)
+
+    fullcollation = createcollation.readcollationfile(fname)
+    createcollation.readoffsetsfile(offsetsfname)
+
+    others = [f for f in filelist if f != name]
+    if fullcollation and len(fullcollation[0]) != len(others):
+        print(f"[!] Error! The collation has {len(fullcollation[0])} witnesses, "
+              f"not {len(others)}. Aborting...")
+        sys.exit(1)
+
+    # witnesses are sorted by their file names
+    column = filelist.index(name)
+    sigla = list(defaults.parsigla)
+    if len(sigla) != len(others):
+        # stored before the sigla were; read them off the <witness> elements
+        sigla = [getdata.stream_file(path.join(defaults.datadir, f + ".xml"))[0]
+                 for f in others]
+
+    print(f"Parsing {name}...")
+    defaults.sigla = []
+    witness = Witness(name)
+    sigla.insert(column, witness.id)
+    defaults.sigla = sigla
+    defaults.witnum = len(filelist)
+
+    missing = [xmlid for xmlid in defaults.parxmlids if xmlid not in witness.xml_ids]
+    if missing:
+        print(f"[!] Error! {name} lacks the paragraphs {', '.join(missing)}. Aborting...")
+        sys.exit(1)
+
+    print(f"\nAligning {name} against the collation...")
+    offsets = defaults.paroffsets
+    extended = []
+    newoffsets = [0]
+    for p in tqdm(range(len(defaults.parxmlids))):
+        segments = fullcollation[offsets[p]:offsets[p + 1]]
+        text = witness.get_par_by_xmlid(defaults.parxmlids[p])
+        extended += align_paragraph(segments, text, column, len(others))
+        newoffsets.append(len(extended))
+
+    defaults.paroffsets = newoffsets
+    defaults.xmlids = defaults.parxmlids
+    defaults.parnum = len(defaults.parxmlids)
+
+    # keep the previous collation, and the report of the run which made it
+    backup = defaults.datadir + defaults.prefix + f'_{len(others)}wit'
+    os.replace(fname, backup + '_variants.json')
+    os.replace(offsetsfname, backup + '_offsets.json')
+    print(f"Previous collation kept as {backup}_variants.json...")
+    createcollation.readreportfile()
+    defaults.report.setdefault("added", []).append(name)
+
+    createcollation.writecollationfile(extended, fname)
+    createcollation.writeoffsetsfile(offsetsfname)
+
+    return extended
@@ -5,8 +5,18 @@ n.vaughan@uniandes.edu.co
 Universidad de los Andes, Colombia
 Runs on Python 3.8+ """
 
+import os
 from os import path
 import json
+import time
+import multiprocessing
+from itertools import zip_longest
+
+# memory limits for the collation worker (unix only)
+try:
+    import resource
+except ImportError:
+    resource = None
 
 try:
     import defaults
@@ -31,6 +41,9 @@ except ImportError:
 #     raise ImportError("\n[!] pprint module not available.\nAborting...")
 
 
+pollinterval = 0.5   # seconds between checks on the collation worker
+
+
 # -------------------------------------------------------------------------------
 
 
@@ -55,6 +68,29 @@ def writedatafile(data: list) -> None:
     return
 
 
+# ----------------------------------------------------
+
+def writereportfile() -> None:
+    """ Writes the run report (e.g. paragraphs which fell back
+    to a cheaper collation) as "{datadir}/{reportfile}". """
+    fname = defaults.datadir + defaults.reportfile
+    with open(fname, "w") as outfile:
+        json.dump(defaults.report, outfile, indent=2)
+    return
+
+
+# ----------------------------------------------------
+
+def readreportfile() -> None:
+    """ Reads the report of a previous run (if any) into defaults.report,
+    so that a run extending it (see addwitness) keeps its entries. """
+    fname = defaults.datadir + defaults.reportfile
+    if path.exists(fname):
+        with open(fname, "r") as infile:
+            defaults.report = json.load(infile)
+    return
+
+
 # ----------------------------------------------------
 def qrecreatecollationfile(fname: str) -> bool:
     ans = input(f"[!] {fname} exists. Recreate? (y/[n]) ").lower()
@@ -84,16 +120,205 @@ def readcollationfile(fname: str) -> list:
 
 # ----------------------------------------------------
 
-def processitem(item: any) -> str:
-    if not item:  # if "null" value in the json
+def writeoffsetsfile(fname: str) -> None:
+    """ Writes the xml:id of each collated paragraph and the offset
+    of its first segment in the collation (defaults.parxmlids and
+    defaults.paroffsets), and the sigla of the collated witnesses. """
+    offsets = {"xmlids": defaults.parxmlids, "offsets": defaults.paroffsets,
+               "sigla": defaults.sigla}
+    with open(fname, "w") as outfile:
+        json.dump(offsets, outfile, indent=2)
+    return
+
+
+# ----------------------------------------------------
+
+def readoffsetsfile(fname: str) -> None:
+    """ Reads the paragraph xml:ids, offsets and sigla written
+    by writeoffsetsfile() into defaults. """
+    with open(fname, "r") as infile:
+        offsets = json.load(infile)
+    defaults.parxmlids = offsets["xmlids"]
+    defaults.paroffsets = offsets["offsets"]
+    defaults.parsigla = offsets.get("sigla", [])   # older files lack them
+    return
+
+
+# ----------------------------------------------------
+
+def processcell(cell: any) -> str:
+    """ Returns the reading of a witness in a segment, given
+    the cell (a list of collatex tokens) of the alignment table. """
+    if not cell:  # if the witness has no reading in the segment
         return '---'
-    elif len(item) == 1:  # if there is only one string in segment
-        return str(item[0]["n"])
-    else:  # if there are multiple strings, join them
-        subseg = ""
-        for ss in item:
-            subseg += ss["n"] + " "
-        return subseg.strip()
+    elif len(cell) == 1:  # if there is only one token in segment
+        return str(cell[0].token_data["n"])
+    else:  # if there are multiple tokens, join them
+        return " ".join(tok.token_data["n"] for tok in cell).strip()
+
+
+# ----------------------------------------------------
+
+def tokenise(text: str) -> list:
+    """ Splits a text into tokens as collatex does (punctuation
+    apart), and returns their normalised forms (see processcell). """
+    mycollation = Collation()
+    mycollation.add_plain_witness('', text)
+    return [tok.token_data["n"] for tok in mycollation.witnesses[0].tokens()]
+
+
+# ----------------------------------------------------
+
+def collate_paragraph(witsegs: list) -> list:
+    """
+    Collates a single paragraph, given as a list of tuples
+    (siglum, text), one for each witness.
+    Returns a list of its variation segments, each of which
+    is a list of the readings of all witnesses.
+    """
+    # create a new, empty Collation object
+    mycollation = Collation()
+
+    for witseg in witsegs:
+        # witseg[0] is the witness' siglum
+        # witseg[1] is the contents of a <p>
+        # add_plain_witness requires both
+        mycollation.add_plain_witness(witseg[0], witseg[1])
+
+    # get the alignment table directly from collatex,
+    # thus avoiding a json (de)serialisation.
+    # table.rows[0].cells contains the segments of the first witness,
+    # and so on
+    table = collate(mycollation, output="table")
+    rows = [row.cells for row in table.rows]
+
+    # in each <p>, range across the No. of segments
+    # (all witnesses have the same amount of segments).
+    # in each segment, range across the No. of witnesses
+    return [[processcell(cell) for cell in segment] for segment in zip(*rows)]
+
+
+# ----------------------------------------------------
+
+def align_by_position(witsegs: list) -> list:
+    """
+    Cheap fallback for collate_paragraph: aligns the words
+    of all witnesses by their position in the paragraph,
+    padding the shorter witnesses with '---'.
+    """
+    tokens = [witseg[1].split() for witseg in witsegs]
+    return [list(segment) for segment in zip_longest(*tokens, fillvalue='---')]
+
+
+# ----------------------------------------------------
+
+def address_space() -> int:
+    """ Returns the size (bytes) of the address space of the current
+    process, or 0 where /proc is not available. """
+    try:
+        with open("/proc/self/status") as statusfile:
+            for line in statusfile:
+                if line.startswith("VmSize:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+# ----------------------------------------------------
+
+def limit_memory(maxmemory: int) -> None:
+    """ Caps the address space of the current process
+    (the collation worker) to maxmemory megabytes more than it
+    already takes: a forked worker inherits the parent's (e.g. the
+    parsed witnesses), which must not count against the budget. """
+    if resource is not None and maxmemory > 0:
+        maxbytes = address_space() + maxmemory * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (maxbytes, maxbytes))
+    return
+
+
+# ----------------------------------------------------
+
+class CollationWorker:
+    """ Collates paragraphs in an isolated process, bounded
+    by defaults.collationtimeout (seconds) and
+    defaults.collationmaxmemory (megabytes). Paragraphs exceeding
+    either budget are aligned with align_by_position instead,
+    and their xml:ids recorded in the run report. """
+
+    def __init__(self) -> None:
+        self.timeout = defaults.collationtimeout or None
+        self.maxmemory = defaults.collationmaxmemory
+        self.isolated = bool(self.timeout or self.maxmemory)
+        self.pool = None
+        self.pid = None
+        self.fallbacks = defaults.report.setdefault("fallback", [])
+        if self.isolated:
+            self.start()
+
+    def start(self) -> None:
+        """ Starts a fresh worker process. """
+        self.pool = multiprocessing.Pool(1,
+                                         initializer=limit_memory,
+                                         initargs=(self.maxmemory,))
+        self.pid = self.pool.apply(os.getpid)
+
+    def restart(self) -> None:
+        """ Replaces a stuck or dead worker process. """
+        self.pool.terminate()
+        self.start()
+
+    def alive(self) -> bool:
+        """ Whether the worker process is still running (the OS may
+        kill it when out of memory, and the pool would then wait
+        for its job forever). """
+        return any(p.pid == self.pid for p in multiprocessing.active_children())
+
+    def wait(self, job) -> list:
+        """ Waits for a job until the timeout, checking
+        every pollinterval seconds that the worker is alive. """
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        while not job.ready():
+            if deadline is not None and time.monotonic() >= deadline:
+                raise multiprocessing.TimeoutError
+            if not self.alive():
+                raise MemoryError
+            job.wait(pollinterval)
+        return job.get()
+
+    def collate(self, witsegs: list, xmlid: str) -> list:
+        """ Collates a paragraph within the budget. """
+        try:
+            if not self.isolated:
+                return collate_paragraph(witsegs)
+            return self.wait(self.pool.apply_async(collate_paragraph, (witsegs,)))
+        except multiprocessing.TimeoutError:
+            reason = "timeout"
+            self.restart()
+        except MemoryError:
+            reason = "memory"
+            if self.isolated and not self.alive():
+                self.restart()
+        except Exception as e:
+            reason = "error"
+            print(f"[!] Error! {xmlid} could not be collated: {e}")
+        self.fallbacks.append({"xmlid": xmlid, "reason": reason})
+        return align_by_position(witsegs)
+
+    def close(self) -> None:
+        """ Stops the worker process, and lists the paragraphs
+        which fell back to align_by_position. """
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        for fallback in self.fallbacks:
+            if fallback['reason'] == "error":
+                print(f"[!] {fallback['xmlid']} could not be collated; "
+                      f"aligned by position instead.")
+            else:
+                print(f"[!] {fallback['xmlid']} exceeded the collation {fallback['reason']} "
+                      f"budget; aligned by position instead.")
 
 
 # ----------------------------------------------------
@@ -112,51 +337,37 @@ def createcollation(data: list, firstline: int = 0, lastline: int = 0) -> list:
         lastline = defaults.parnum
 
     fname = defaults.datadir + defaults.prefix + '_variants.json'
+    offsetsfname = defaults.datadir + defaults.prefix + '_offsets.json'
 
     # Check if "{prefix}_variants.json" file exists
     # (to avoid recreating it).
     # If it does, is asks for confirmation.
     # debug: comment the following
-    if path.exists(fname):
+    if path.exists(fname) and path.exists(offsetsfname):
         if not qrecreatecollationfile(fname):
+            readoffsetsfile(offsetsfname)
             return readcollationfile(fname)
 
     fullcollation = []
+    # paroffsets[i] is the index in fullcollation of the first segment
+    # of the i-th collated paragraph; the last entry is the total
+    # No. of segments
+    defaults.parxmlids = defaults.xmlids[firstline:lastline]
+    defaults.paroffsets = [0]
 
     print("\nCreating collation of variants...")
 
+    worker = CollationWorker()
+
     # range across the No. of <p> ---------------------------------------------
     for parnum in tqdm(range(firstline, lastline)):
-        # create a new, empty Collation object
-        mycollation = Collation()
-
-        for witseg in data[parnum]:
-            # witseg[0] is the witness' siglum
-            # witseg[1] is the contents of a <p>
-            # add_plain_witness requires both
-            mycollation.add_plain_witness(witseg[0], witseg[1])
-
-        # build a dictionary from the json object
-        # resulting from the collation.
-        # the dictionary has two items:
-        # first, "table", the table of differences;
-        # second, "witnesses", the table of sigla of the witnesses
-        colldict = json.loads(collate(mycollation, output="json"))
-
-        # store the "table" part of the collation
-        # table[0] contains the segments of the first witness, and so on
-        table = colldict["table"]
-
-        # get amount of segments in each paragraph
-        # (in first witness only, as all are equal in length)
-        segnum = len(table[0])
-
-        # in each <p>, range across the No. of segments
-        for s in range(segnum):
-            # in each segment, range across the No. of witnesses
-            variants = [processitem(wit[s]) for wit in table]
-            fullcollation.append(variants)
+        segments = worker.collate(data[parnum], defaults.xmlids[parnum])
+        fullcollation.extend(segments)
+        defaults.paroffsets.append(len(fullcollation))
+
+    worker.close()
 
     writecollationfile(fullcollation, fname)
+    writeoffsetsfile(offsetsfname)
 
     return fullcollation
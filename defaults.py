@@ -12,9 +12,26 @@ defaultdatadir: str
 tempdatadir: str
 resultfile: str
 plotresults: bool
+reportfile: str
+collationtimeout: int     # seconds per paragraph (0 = no limit)
+collationmaxmemory: int   # megabytes per paragraph (0 = no limit)
+similaritythreshold: float
+excludeflagged: bool
+serverhost: str
+serverport: int
+watchinterval: int   # seconds between checks of the data directory
+storeresults: bool
+heatmap: bool
+heatmapbins: int   # max. No. of bins of paragraphs and of positions
+fuzzythreshold: float   # max. normalised edit distance of same readings (0 = exact)
 
 sigla = []    # dynamically assigned later in witnesses.py
 datadir: str   # dynamically assigned later in set_globals_from_datafile()
 prefix: str    # dynamically assigned later in set_globals_from_datafile()
 witnum: int    # dynamically assigned later in set_globals_from_datafile()
 parnum: int    # dynamically assigned later in checkwitnesses()
+xmlids = []   # dynamically assigned later in checkwitnesses()
+parxmlids = []    # dynamically assigned later in createcollation()
+paroffsets = []   # dynamically assigned later in createcollation()
+parsigla = []     # sigla of a stored collation, read by readoffsetsfile()
+report = {}   # run report, filled along the run and written to reportfile
@@ -24,6 +24,11 @@ try:
 except ImportError:
     raise ImportError("\n[!] bs4 module not available.\nAborting...")
 
+try:
+    from lxml import etree
+except ImportError:
+    raise ImportError("\n[!] lxml module not available.\nAborting...")
+
 try:
     from xmlcleaners import meta_cleanup, clean_str
 except ImportError:
@@ -169,6 +174,17 @@ def get_wit_id(file: str) -> str:
     return wit
 
 
+# ---------------------------------------------------------
+
+def paragraph_text(parag) -> str:
+    """ Returns the cleaned text of a (cleaned up) <p> tag. """
+    buf = ''
+    for pa in parag:
+        pa = str(pa)
+        buf += str(pa)
+    return clean_str(buf)
+
+
 # ---------------------------------------------------------
 
 def parse_file(fname: str) -> list:
@@ -190,15 +206,7 @@ def parse_file(fname: str) -> list:
 
     paragraphs = soup.find_all(p_with_id)
 
-    p_tags = []
-
-    for parag in paragraphs:
-        buf = ''
-        for pa in parag:
-            pa = str(pa)
-            buf += str(pa)
-        buf = clean_str(buf)
-        p_tags.append(buf)
+    p_tags = [paragraph_text(parag) for parag in paragraphs]
 
     # Provides a list of all @xml:ids containing "b1d3qun":
     xml_ids = [p["xml:id"] for p in paragraphs]
@@ -210,6 +218,54 @@ def parse_file(fname: str) -> list:
     return list(zip(xml_ids, p_tags))
 
 
+# ---------------------------------------------------------
+
+XMLID = '{http://www.w3.org/XML/1998/namespace}id'
+
+
+def stream_file(fname: str) -> tuple:
+    """ Incrementally parses a given TEI-XML file.
+    Returns a tuple with the witness id and a generator
+    of its paragraphs, like so:
+    ('#V', <('b1d3qun-cdtvet', 'circa ...'), etc.>)
+    Only one <p> is kept in memory at a time.
+    """
+    context = etree.iterparse(fname, events=("end",),
+                               remove_comments=True, remove_pis=True)
+
+    # the <witness> element comes before the text
+    wit = ''
+    for event, elem in context:
+        if etree.QName(elem).localname == 'witness':
+            wit = '#' + elem.get(XMLID)
+            break
+
+    def paragraphs():
+        for event, elem in context:
+            if etree.QName(elem).localname == 'p' and \
+                    elem.get(XMLID) is not None and \
+                    elem.get('ana') is None:  # needed to escape some headings
+                fragment = BeautifulSoup(etree.tostring(elem, encoding='unicode'), "lxml-xml")
+                fragment = meta_cleanup(fragment)
+                yield elem.get(XMLID), paragraph_text(fragment.find('p'))
+                free(elem)
+            elif not any(etree.QName(a).localname == 'p' for a in elem.iterancestors()):
+                # finished structure around the paragraphs (<head>s, <div>s, etc.)
+                free(elem)
+
+    return wit, paragraphs()
+
+
+def free(elem) -> None:
+    """ Frees a finished element and whatever preceded it,
+    at every level of the tree. """
+    elem.clear(keep_tail=True)
+    while elem.getparent() is not None:
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+        elem = elem.getparent()
+
+
 # ---------------------------------------------------------
 
 
@@ -234,5 +290,6 @@ def checkwitnesses(witnesses: list) -> None:
     print('OK!')
 
     defaults.parnum = len(witnesses[0])  # set globals.parnum
+    defaults.xmlids = witnesses[0].xml_ids  # set globals.xmlids
     print(f"Number of total paragraphs: {defaults.parnum}")
     return
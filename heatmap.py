@@ -0,0 +1,144 @@
+""" heatmap.py
+Part of Witness Relationships v.0.1
+🄯 2022 Nicolas Vaughan
+n.vaughan@uniandes.edu.co
+Universidad de los Andes, Colombia
+Runs on Python 3.8+ """
+
+import json
+import threading
+from itertools import accumulate
+
+try:
+    import defaults
+except ImportError:
+    raise ImportError("\n[!] defaults module not available.\nAborting...")
+
+try:
+    from patternindex import PatternIndex
+except ImportError:
+    raise ImportError("\n[!] patternindex module not available.\nAborting...")
+
+try:
+    # noinspection PyUnresolvedReferences
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+except ImportError:
+    go = None
+
+try:
+    import kaleido
+except ImportError:
+    kaleido = None
+
+
+# ------------------------------------------------------------------------------
+def bin_edges(total: int, bins: int) -> list:
+    """ Splits range(total) into at most bins (nearly) equal ranges,
+    returning their edges, e.g. [0, 34, 67, 100] ([0] if total == 0). """
+    if total == 0:
+        return [0]
+    bins = max(min(bins, total), 1)
+    return [round(i * total / bins) for i in range(bins + 1)]
+
+
+# ------------------------------------------------------------------------------
+def bin_paragraphs(index: PatternIndex, bins: int) -> dict:
+    """
+    Bins the paragraphs, and returns the share (%) of each variant pattern
+    among the variant segments of each bin, labelled by the xml:id of
+    the first paragraph in the bin.
+    """
+    edges = bin_edges(index.parnum, bins)
+    totals = index.counts()
+    codes = sorted((code for code in totals if code.strip('A')),
+                   key=lambda code: totals[code], reverse=True)
+    shares = []
+    for first, last in zip(edges, edges[1:]):
+        counts = index.counts(first, last)
+        varnum = sum(counts[code] for code in codes)
+        shares.append([round(counts[code] / varnum * 100, 2) if varnum else 0.0
+                       for code in codes])
+    return {"codes": codes,
+            "paragraphs": [index.xmlids[first] for first in edges[:-1]],
+            "shares": shares}
+
+
+# ------------------------------------------------------------------------------
+def bin_positions(values: list, bins: int) -> dict:
+    """
+    Bins the segments (given by their classification, see
+    processcollation.classify_segments) by their position in the
+    whole text, and returns the density of variation (% of segments
+    other than 'AAAA') of each bin.
+    """
+    edges = bin_edges(len(values), bins)
+    variant = [0] + list(accumulate(value != 0 for value in values))
+    density = [round((variant[last] - variant[first]) / (last - first) * 100, 2)
+               if last > first else 0.0
+               for first, last in zip(edges, edges[1:])]
+    return {"positions": edges[:-1], "density": density}
+
+
+# ------------------------------------------------------------------------------
+def render(binned: dict, fname: str) -> None:
+    """ Draws the heatmap and the density track, and writes them
+    as a static image through kaleido (no browser needed). """
+    fig = make_subplots(rows=2, cols=1, row_heights=[0.8, 0.2],
+                        vertical_spacing=0.08,
+                        subplot_titles=("Patterns by paragraph (%)",
+                                        "Density of variation (%)"))
+    paragraphs = binned["paragraphs"]
+    fig.add_trace(go.Heatmap(z=paragraphs["shares"],
+                             x=paragraphs["codes"],
+                             y=paragraphs["paragraphs"],
+                             colorscale="Viridis"),
+                  row=1, col=1)
+    fig.add_trace(go.Scatter(x=binned["positions"]["positions"],
+                             y=binned["positions"]["density"],
+                             mode="lines", fill="tozeroy"),
+                  row=2, col=1)
+    fig.update_yaxes(autorange="reversed", row=1, col=1)
+    fig.update_xaxes(title_text="segment", row=2, col=1)
+    fig.update_layout(height=1200, width=900, showlegend=False,
+                      title=f'Variants for {defaults.prefix}')
+    fig.write_image(fname)
+    return
+
+
+# ------------------------------------------------------------------------------
+def writeheatmap(segmentlist: list, values: list) -> None:
+    """
+    Bins the collation (classified as values, see
+    processcollation.classify_segments) by paragraph and by position
+    (at most defaults.heatmapbins bins each), writes the bins as
+    "{prefix}_heatmap.json" and renders them as "{prefix}_heatmap.png".
+    """
+    if not values:
+        print("[!] The collation is empty. Heatmap not built...")
+        return
+    fname = defaults.datadir + defaults.prefix + "_heatmap"
+    index = PatternIndex(segmentlist, defaults.paroffsets, defaults.parxmlids, values)
+    binned = {"paragraphs": bin_paragraphs(index, defaults.heatmapbins),
+              "positions": bin_positions(values, defaults.heatmapbins)}
+    with open(fname + ".json", "w") as outfile:
+        json.dump(binned, outfile, indent=2)
+
+    if go is None or kaleido is None:
+        print("[!] Plotly or kaleido module not available. Heatmap not rendered...")
+        return
+    try:
+        render(binned, fname + ".png")
+    except Exception as e:
+        print(f"[!] Error! Heatmap could not be rendered: {e}")
+    return
+
+
+# ------------------------------------------------------------------------------
+def start_heatmap(segmentlist: list, values: list) -> threading.Thread:
+    """ Builds the heatmap in a background thread,
+    which the caller should join() before exiting. """
+    print("Building heatmap in the background...")
+    worker = threading.Thread(target=writeheatmap, args=(segmentlist, values))
+    worker.start()
+    return worker
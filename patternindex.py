@@ -0,0 +1,105 @@
+""" patternindex.py
+Part of Witness Relationships v.0.1
+🄯 2022 Nicolas Vaughan
+n.vaughan@uniandes.edu.co
+Universidad de los Andes, Colombia
+Runs on Python 3.8+ """
+
+import heapq
+from collections import Counter
+from itertools import accumulate
+
+try:
+    import defaults
+except ImportError:
+    raise ImportError("\n[!] defaults module not available.\nAborting...")
+
+try:
+    import processcollation
+except ImportError:
+    raise ImportError("\n[!] processcollation module not available.\nAborting...")
+
+try:
+    import createcollation
+except ImportError:
+    raise ImportError("\n[!] createcollation module not available.\nAborting...")
+
+
+# ------------------------------------------------------------------------------
+
+
+class PatternIndex:
+    """ Cumulative per-pattern counts of segments over paragraphs.
+    self.prefix["ABBB"][i] is the No. of ABBB segments in the
+    first i paragraphs, so that any range of paragraphs is
+    answered with one subtraction per pattern. """
+
+    def __init__(self, segmentlist: list, offsets: list, xmlids: list,
+                 values: list = None) -> None:
+        """ values are the segments already classified
+        (see processcollation.classify_segments), if known. """
+        self.xmlids = xmlids
+        self.parnum = len(xmlids)
+        self.prefix = {}
+        if values is None:
+            values = processcollation.classify_segments(segmentlist)
+        self.build(values, offsets)
+
+    @classmethod
+    def from_files(cls):
+        """ Builds the index from the "{prefix}_variants.json" and
+        "{prefix}_offsets.json" files in the data directory. """
+        fname = defaults.datadir + defaults.prefix + '_variants.json'
+        offsetsfname = defaults.datadir + defaults.prefix + '_offsets.json'
+        segmentlist = createcollation.readcollationfile(fname)
+        createcollation.readoffsetsfile(offsetsfname)
+        return cls(segmentlist, defaults.paroffsets, defaults.parxmlids)
+
+    def build(self, values: list, offsets: list) -> None:
+        """ Accumulates the pattern counts of the classified
+        segments paragraph by paragraph. """
+        parcounts = [Counter(values[offsets[p]:offsets[p + 1]])
+                     for p in range(self.parnum)]
+        patterns = set().union(*parcounts)
+        for value in sorted(patterns):
+            code = processcollation.pattern_name(value)
+            counts = (parcount[value] for parcount in parcounts)
+            self.prefix[code] = [0] + list(accumulate(counts))
+
+    def index_of(self, xmlid: str) -> int:
+        """ Returns the index of a paragraph given its xml:id. """
+        return self.xmlids.index(xmlid)
+
+    def counts(self, first: int = 0, last: int = 0) -> dict:
+        """ Returns the No. of segments of each pattern
+        in paragraphs first to last (excluded).
+        last == 0 means up to the last paragraph. """
+        if last == 0:
+            last = self.parnum
+        if not 0 <= first <= last <= self.parnum:
+            raise ValueError(f"paragraphs {first} to {last} are not "
+                             f"within 0 to {self.parnum}")
+        return {code: prefix[last] - prefix[first]
+                for code, prefix in self.prefix.items()}
+
+    def percentages(self, first: int = 0, last: int = 0) -> list:
+        """ Like processcollation.calculate_percentages,
+        but for paragraphs first to last (excluded) only. """
+        return processcollation.calculate_code_percentages(self.counts(first, last))
+
+    def paragraph(self, index: int) -> dict:
+        """ Returns the pattern counts of a single paragraph. """
+        if not 0 <= index < self.parnum:
+            raise ValueError(f"paragraph {index} is not within 0 to {self.parnum - 1}")
+        counts = self.counts(index, index + 1)
+        return {code: count for code, count in counts.items() if count > 0}
+
+    def top(self, code: str, k: int = 20) -> list:
+        """ Returns the k paragraphs with the most segments
+        of a pattern, as tuples (index, xml:id, count). """
+        prefix = self.prefix.get(code)
+        if prefix is None:
+            return []
+        top = heapq.nlargest(k, range(self.parnum),
+                             key=lambda p: prefix[p + 1] - prefix[p])
+        return [(p, self.xmlids[p], prefix[p + 1] - prefix[p]) for p in top]
@@ -0,0 +1,111 @@
+""" prefilter.py
+Part of Witness Relationships v.0.1
+🄯 2022 Nicolas Vaughan
+n.vaughan@uniandes.edu.co
+Universidad de los Andes, Colombia
+Runs on Python 3.8+ """
+
+import heapq
+import zlib
+from itertools import combinations
+
+try:
+    import defaults
+except ImportError:
+    raise ImportError("\n[!] defaults module not available.\nAborting...")
+
+
+shinglesize = 5     # characters per shingle
+sketchsize = 64     # hashes kept in each MinHash signature
+
+
+# ------------------------------------------------------------------------------
+def signature(text: str) -> list:
+    """
+    Returns the (bottom-k) MinHash signature of a paragraph:
+    the sorted sketchsize smallest hashes of its character shingles.
+    """
+    text = text.encode('utf-8')
+    last = max(len(text) - shinglesize + 1, 1)
+    hashes = {zlib.crc32(text[i:i + shinglesize]) for i in range(last)}
+    return heapq.nsmallest(sketchsize, hashes)
+
+
+# ------------------------------------------------------------------------------
+def similarity(sig1: list, sig2: list) -> float:
+    """
+    Estimates the Jaccard similarity of two paragraphs
+    from their signatures.
+    """
+    union = heapq.nsmallest(sketchsize, set(sig1) | set(sig2))
+    if not union:
+        return 1.0
+    common = set(sig1) & set(sig2)
+    shared = sum(1 for h in union if h in common)
+    return shared / len(union)
+
+
+# ------------------------------------------------------------------------------
+def check_row(index: int, xmlids: list, texts: list) -> dict:
+    """
+    Checks a tuple of parallel paragraphs, given their xml:ids and texts.
+    Returns None if they look alright, or, if their xml:ids disagree or
+    their lowest similarity between two witnesses falls below
+    defaults.similaritythreshold:
+    {"index": 12, "xmlid": "b1d3qun-cdtvet", "similarity": 0.21}
+    """
+    signatures = [signature(text) for text in texts]
+    lowest = min((similarity(sig1, sig2)
+                  for sig1, sig2 in combinations(signatures, 2)),
+                 default=1.0)
+    xmlids = set(xmlids)
+    if len(xmlids) > 1 or lowest < defaults.similaritythreshold:
+        return {"index": index,
+                "xmlid": " ".join(sorted(xmlids)),
+                "similarity": round(lowest, 2)}
+    return None
+
+
+# ------------------------------------------------------------------------------
+def warn(item: dict) -> None:
+    print(f"[!] Paragraph {item['index']} ({item['xmlid']}) "
+          f"looks misaligned (similarity {item['similarity']}).")
+
+
+# ------------------------------------------------------------------------------
+def check_paragraphs(witnesses: list) -> list:
+    """
+    Checks every tuple of parallel paragraphs before collation
+    (see check_row). Returns a list of the suspicious ones.
+    """
+    print('Checking paragraph similarity... ', end='')
+    flagged = []
+
+    for p in range(defaults.parnum):
+        item = check_row(p,
+                         [w.xml_ids[p] for w in witnesses],
+                         [w.paragraphs[p] for w in witnesses])
+        if item is not None:
+            flagged.append(item)
+
+    print('OK!')
+    for item in flagged:
+        warn(item)
+
+    defaults.report["flagged"] = flagged
+    return flagged
+
+
+# ------------------------------------------------------------------------------
+def exclude_paragraphs(data: list, flagged: list) -> list:
+    """
+    Removes the flagged paragraphs from the data list
+    (see createcollation.prepare_collation), and updates
+    defaults.xmlids and defaults.parnum accordingly.
+    """
+    excluded = {item["index"] for item in flagged}
+    keep = [p for p in range(len(data)) if p not in excluded]
+    defaults.xmlids = [defaults.xmlids[p] for p in keep]
+    defaults.parnum = len(keep)
+    print(f"Excluding {len(excluded)} flagged paragraphs...")
+    return [data[p] for p in keep]
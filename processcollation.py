@@ -5,8 +5,9 @@ n.vaughan@uniandes.edu.co
 Universidad de los Andes, Colombia
 Runs on Python 3.8+ """
 
-import itertools
 import operator
+from collections import Counter
+from functools import lru_cache
 
 # try:
 #     import pandas
@@ -18,6 +19,12 @@ try:
 except ImportError:
     raise ImportError("\n[!] defaults module not available.\nAborting...")
 
+try:
+    import Levenshtein
+except ImportError:
+    print("[!] Levenshtein module not available. Comparing readings exactly...")
+    Levenshtein = None
+
 try:
     # noinspection PyUnresolvedReferences
     import plotly.graph_objects as go
@@ -32,57 +39,114 @@ except ImportError:
     defaults.plotresults = False
 
 
-# ------------------------------------------------------------------------------
-def generate_permutations() -> list:
+fuzzycachesize = 2 ** 20   # reading pairs whose distance is remembered
+
+
+# -----------------------------------------------------------------------------------
+@lru_cache(maxsize=fuzzycachesize)
+def normalised_distance(reading1: str, reading2: str) -> float:
+    """
+    Returns the edit distance between two readings, divided by
+    the length of the longest. Called once per distinct pair of
+    readings (in sorted order) for the whole corpus.
+    """
+    return Levenshtein.distance(reading1, reading2) / max(len(reading1), len(reading2))
+
+
+# -----------------------------------------------------------------------------------
+def same_reading(reading1: str, reading2: str) -> bool:
+    """
+    Compares two readings. If defaults.fuzzythreshold > 0, readings
+    within that normalised edit distance (e.g. "imago" and "ymago")
+    count as the same. Omissions ('---') are only the same as omissions.
+    """
+    if reading1 == reading2:
+        return True
+    if not defaults.fuzzythreshold or Levenshtein is None \
+            or '---' in (reading1, reading2):
+        return False
+    if reading2 < reading1:
+        reading1, reading2 = reading2, reading1
+    return normalised_distance(reading1, reading2) <= defaults.fuzzythreshold
+
+
+# -----------------------------------------------------------------------------------
+def pattern_code(inputlist) -> str:
+    """
+    Given a single inputlist of variations (segments), the function
+    compares them and assigns a string (e.g. 'ABBD') to the comparison:
+    each witness gets the letter of the first witness
+    with the same reading (see same_reading).
+    Readings are compared only with the first reading of each group,
+    so that near-equality does not chain across groups.
+    """
+    if not defaults.fuzzythreshold:
+        return "".join(chr(65 + inputlist.index(reading)) for reading in inputlist)
+    letters = []
+    firsts = []   # the witness which starts each group
+    for i, reading in enumerate(inputlist):
+        first = next((j for j in firsts if same_reading(inputlist[j], reading)), None)
+        if first is None:
+            firsts.append(i)
+            first = i
+        letters.append(chr(65 + first))
+    return "".join(letters)
+
+
+# -----------------------------------------------------------------------------------
+def pattern_value(code: str) -> int:
+    """
+    Returns the index of a code (e.g. 'ABBD') in the permutation list
+    (all codes of witnum letters: 'AAAA', 'AAAB', ...),
+    without generating it.
+    """
+    value = 0
+    for letter in code:
+        value = value * len(code) + ord(letter) - 65
+    return value
+
+
+# -----------------------------------------------------------------------------------
+def pattern_name(value: int) -> str:
     """
-    Creates a list of strings containing all permutations:
-    ["AAAA", "AAAB", ...]
-    len = (witnum ** 2)
+    Returns the code (e.g. 'ABBD') at an index of the permutation list,
+    without generating it.
     """
     witnum = defaults.witnum
-    x = []
+    letters = []
     for i in range(witnum):
-        x.append(chr(65 + i))
-    out = [list(p) for p in itertools.product(x, repeat=witnum)]
-    return out
+        value, letter = divmod(value, witnum)
+        letters.append(chr(65 + letter))
+    return "".join(reversed(letters))
 
 
 # -----------------------------------------------------------------------------------
 def classify_variant_set(inputlist) -> int:
     """
     Given a single inputlist of variations (segments), the function
-    compares them and assigns a string (e.g. 'ABBD') to the comparison.
-    Then it searches that string in the variationlist and returns
-    its index integer.
-    ----
-    TODO: generalise for an arbitrary number of witnesses.
-    Currently only works for four. (4 ** 2) == 256
-    """
-    out = ['A']
-    if inputlist[0] == inputlist[1]:
-        out.append('A')
-    else:
-        out.append('B')
-
-    if inputlist[0] == inputlist[2]:
-        out.append('A')
-    elif inputlist[1] == inputlist[2]:
-        out.append('B')
-    else:
-        out.append('C')
-
-    if inputlist[0] == inputlist[3]:
-        out.append('A')
-    elif inputlist[1] == inputlist[3]:
-        out.append('B')
-    elif inputlist[2] == inputlist[3]:
-        out.append('C')
-    else:
-        out.append('D')
-
-    # returns the index of the variation in the variation list
-    permutations = generate_permutations()
-    return permutations.index(out)
+    assigns a code to the comparison (see pattern_code)
+    and returns its index in the permutation list.
+    """
+    return pattern_value(pattern_code(inputlist))
+
+
+# -----------------------------------------------------------------------------
+def classify_segments(segmentlist: list) -> list:
+    """For each segment, classify the kind of
+    variation according the permutation list.
+    Return a list of integers correponding to
+    the index of the permutation list (one for each segment,
+    "0" included). Identical segments are classified only once.
+    """
+    values = {}
+    out = []
+    for segment in segmentlist:
+        segment = tuple(segment)
+        value = values.get(segment)
+        if value is None:
+            value = values[segment] = classify_variant_set(segment)
+        out.append(value)
+    return out
 
 
 # -----------------------------------------------------------------------------
@@ -92,39 +156,40 @@ def classify_variations(segmentlist: list) -> list:
     Return a list of integers correponding to
     the index of the permutation list.
     """
-    freqlist = []
-    for segment in segmentlist:
-        value = classify_variant_set(segment)
-        # prune "0" freqs
-        if value == 0:
-            continue
-        freqlist.append(value)
-    return freqlist
+    # prune "0" freqs
+    return [value for value in classify_segments(segmentlist) if value != 0]
 
 
 # -----------------------------------------------------------------------------
 
 def calculate_percentages(variationlist: list) -> list:
-    varnum = len(variationlist)
-    percentlist = []
-    templist = []
-    permutations = generate_permutations()
-
-    # count the number of occurances of item on a list
-    def countocc(lst: list, x: int) -> int:
-        accurances = 0
-        for ele in lst:
-            if ele == x:
-                accurances += 1
-        return accurances
-
-    for value in variationlist:
-        count = countocc(variationlist, value)
-        percentage = round(count / varnum * 100, 2)
-        if value not in templist:  # ensure no repetitions
-            outlist = ["".join(permutations[value]), percentage]
-            percentlist.append(outlist)
-        templist.append(value)
+    return calculate_percentages_from_counts(Counter(variationlist))
+
+
+# -----------------------------------------------------------------------------
+
+def calculate_percentages_from_counts(counts: Counter) -> list:
+    """Like calculate_percentages, but given the No. of occurrences
+    of each variation (e.g. folded along a streamed collation).
+    """
+    return calculate_code_percentages({pattern_name(value): count
+                                       for value, count in counts.items()})
+
+
+# -----------------------------------------------------------------------------
+
+def calculate_code_percentages(codecounts: dict) -> list:
+    """Given the No. of occurrences of each code (e.g. 'ABBD'),
+    returns the list of their percentages, sorted inversely.
+    Codes of full agreement (e.g. 'AAAA') are left out.
+    """
+    codecounts = {code: count for code, count in codecounts.items()
+                  if count > 0 and code.strip('A')}
+    varnum = sum(codecounts.values())
+    if varnum == 0:
+        return []
+    percentlist = [[code, round(count / varnum * 100, 2)]
+                   for code, count in codecounts.items()]
 
     # sort them inversely according to percentage
     percentlist = sorted(percentlist, key=operator.itemgetter(1), reverse=True)
@@ -152,12 +217,12 @@ def generate_plot(percentlist: list) -> None:
     percentages = [value[1] for value in percentlist]
     varnames = [value[0] for value in percentlist]
 
-    for item in percentlist:
-        line = f"{item[0]}: {str(item[1])}%"
-        print(line)
-        fname = defaults.datadir + defaults.resultfile
-        with open(fname, "w") as file:
-            file.write(line)
+    fname = defaults.datadir + defaults.resultfile
+    with open(fname, "w") as file:
+        for item in percentlist:
+            line = f"{item[0]}: {str(item[1])}%"
+            print(line)
+            file.write(line + "\n")
 
     if defaults.plotresults:
         trace = go.Pie(labels=varnames,
@@ -0,0 +1,105 @@
+""" profiles.py
+Part of Witness Relationships v.0.1
+🄯 2022 Nicolas Vaughan
+n.vaughan@uniandes.edu.co
+Universidad de los Andes, Colombia
+Runs on Python 3.8+ """
+
+import re
+import json
+from functools import lru_cache
+
+try:
+    import defaults
+except ImportError:
+    raise ImportError("\n[!] defaults module not available.\nAborting...")
+
+try:
+    import processcollation
+except ImportError:
+    raise ImportError("\n[!] processcollation module not available.\nAborting...")
+
+
+# ------------------------------------------------------------------------------
+# Orthographic normalisation profiles, applied to the (already collated)
+# readings at classification time. Each one is a list of substitutions.
+
+uvij = [(r"v", "u"),
+        (r"[jy]", "i"), ]
+
+ct = [(r"c(?=i[aeiou])", "t"), ]   # e.g. "gracia" -> "gratia"
+
+abbrev = [(r"[&⁊]", "et"),
+          (r"ꝑ", "per"),
+          (r"ꝓ", "pro"),
+          (r"ꝙ", "quod"),
+          (r"ꝯ", "con"), ]
+
+profiles = {
+    "raw": [],
+    "uvij": uvij,
+    "ct": ct,
+    "abbrev": abbrev,
+    "all": uvij + ct + abbrev,
+}
+
+
+# ------------------------------------------------------------------------------
+@lru_cache(maxsize=2 ** 20)
+def normalise(profile: str, reading: str) -> str:
+    """ Applies a profile to a reading. Each distinct reading
+    is normalised only once per profile. """
+    for pattern, replacement in profiles[profile]:
+        reading = re.sub(pattern, replacement, reading)
+    return reading
+
+
+# ------------------------------------------------------------------------------
+def normalise_segments(segmentlist: list, profile: str):
+    """ Yields the segments with their readings normalised. """
+    for segment in segmentlist:
+        yield [normalise(profile, reading) for reading in segment]
+
+
+# ------------------------------------------------------------------------------
+def profile_percentages(segmentlist: list, names: list, percentlist: list = None) -> dict:
+    """
+    Returns the percentages (see processcollation.calculate_percentages)
+    of the same collation under each of the named profiles.
+    percentlist are those of the raw collation, if already known.
+    """
+    results = {}
+    for name in names:
+        if name not in profiles:
+            print(f"[!] Unknown normalisation profile: {name}. Skipping...")
+            continue
+        if name == "raw" and percentlist is not None:
+            results[name] = percentlist
+            continue
+        print(f"Classifying variations with the {name} profile...")
+        variationlist = processcollation.classify_variations(
+            normalise_segments(segmentlist, name))
+        results[name] = processcollation.calculate_percentages(variationlist)
+    return results
+
+
+# ------------------------------------------------------------------------------
+def writeprofilesfile(results: dict) -> None:
+    """ Prints the percentages of all profiles side by side and
+    writes them as "{prefix}_profiles.json". """
+    names = list(results)
+    table = {name: dict(percentlist) for name, percentlist in results.items()}
+    codes = []
+    for percentlist in results.values():
+        codes += [item[0] for item in percentlist if item[0] not in codes]
+
+    width = defaults.witnum + 2
+    print(f"{'code':<{width}}" + "".join(f"{name:>9}" for name in names))
+    for code in codes:
+        cells = "".join(f"{table[name].get(code, 0.0):>8}%" for name in names)
+        print(f"{code:<{width}}{cells}")
+
+    fname = defaults.datadir + defaults.prefix + "_profiles.json"
+    with open(fname, "w") as outfile:
+        json.dump(results, outfile, indent=2)
+    return
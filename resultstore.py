@@ -0,0 +1,170 @@
+""" resultstore.py
+Part of Witness Relationships v.0.1
+🄯 2022 Nicolas Vaughan
+n.vaughan@uniandes.edu.co
+Universidad de los Andes, Colombia
+Runs on Python 3.8+ """
+
+import os
+import sqlite3
+from os import path
+
+try:
+    import defaults
+except ImportError:
+    raise ImportError("\n[!] defaults module not available.\nAborting...")
+
+try:
+    import processcollation
+except ImportError:
+    raise ImportError("\n[!] processcollation module not available.\nAborting...")
+
+
+batchsize = 50000   # rows per executemany()
+
+schema = """
+CREATE TABLE witnesses (
+    id INTEGER PRIMARY KEY,     -- column of the witness in the codes
+    siglum TEXT NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE TABLE paragraphs (
+    id INTEGER PRIMARY KEY,     -- index of the paragraph
+    xmlid TEXT NOT NULL
+);
+CREATE TABLE segments (
+    id INTEGER PRIMARY KEY,     -- index of the segment in the collation
+    paragraph INTEGER NOT NULL REFERENCES paragraphs(id),
+    position INTEGER NOT NULL,  -- index of the segment in its paragraph
+    pattern TEXT NOT NULL       -- e.g. 'ABBD'
+);
+CREATE TABLE readings (
+    id INTEGER PRIMARY KEY,
+    segment INTEGER NOT NULL REFERENCES segments(id),
+    witness INTEGER NOT NULL REFERENCES witnesses(id),
+    reading TEXT NOT NULL
+);
+"""
+
+indexes = """
+CREATE UNIQUE INDEX paragraphs_xmlid ON paragraphs(xmlid);
+CREATE INDEX segments_paragraph ON segments(paragraph, pattern);
+CREATE INDEX segments_pattern ON segments(pattern);
+CREATE INDEX readings_segment ON readings(segment);
+CREATE INDEX readings_reading ON readings(reading, witness);
+"""
+
+fulltext = """
+CREATE VIRTUAL TABLE readings_fts USING fts5(reading, content='readings', content_rowid='id');
+INSERT INTO readings_fts(readings_fts) VALUES ('rebuild');
+"""
+
+
+# ------------------------------------------------------------------------------
+def batches(rows):
+    """ Splits an iterable of rows into lists of batchsize rows. """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batchsize:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ------------------------------------------------------------------------------
+def writeresultstore(segmentlist: list, names: list, values: list = None) -> None:
+    """
+    Writes the collation as "{prefix}_results.sqlite", with
+    the xml:id and position of every segment, its pattern code and
+    the reading of each witness (also indexed for full-text search).
+    names are the file names of the witnesses, and values the segments
+    already classified (see processcollation.classify_segments), if known.
+    """
+    fname = defaults.datadir + defaults.prefix + "_results.sqlite"
+    print(f"Writing to file: {fname}...")
+    if path.exists(fname):
+        os.remove(fname)
+
+    if values is None:
+        values = processcollation.classify_segments(segmentlist)
+    offsets = defaults.paroffsets
+
+    def segments():
+        for p in range(len(defaults.parxmlids)):
+            for s in range(offsets[p], offsets[p + 1]):
+                yield s, p, s - offsets[p], processcollation.pattern_name(values[s])
+
+    def readings():
+        for s, segment in enumerate(segmentlist):
+            for w, reading in enumerate(segment):
+                yield s, w, reading
+
+    conn = sqlite3.connect(fname)
+    # bulk load: no journal, no syncing, indexes built afterwards
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    with conn:
+        conn.executescript(schema)
+        conn.executemany("INSERT INTO witnesses VALUES (?, ?, ?)",
+                         zip(range(len(names)), defaults.sigla, names))
+        conn.executemany("INSERT INTO paragraphs VALUES (?, ?)",
+                         enumerate(defaults.parxmlids))
+        for batch in batches(segments()):
+            conn.executemany("INSERT INTO segments VALUES (?, ?, ?, ?)", batch)
+        for batch in batches(readings()):
+            conn.executemany("INSERT INTO readings (segment, witness, reading) "
+                             "VALUES (?, ?, ?)", batch)
+        conn.executescript(indexes)
+    try:
+        with conn:
+            conn.executescript(fulltext)
+    except sqlite3.OperationalError:
+        print("[!] SQLite was built without FTS5. Skipping full-text index...")
+    conn.close()
+    return
+
+
+# ------------------------------------------------------------------------------
+def segments_by_pattern(conn: sqlite3.Connection, pattern: str, xmlid: str = '') -> list:
+    """
+    Returns the segments of a pattern (in a paragraph, if its
+    xml:id is given), as tuples (xml:id, position, readings).
+    """
+    query = """
+        SELECT paragraphs.xmlid, segments.position,
+               group_concat(readings.reading, ' | ')
+        FROM segments
+        JOIN paragraphs ON paragraphs.id = segments.paragraph
+        JOIN readings ON readings.segment = segments.id
+        WHERE segments.pattern = ?"""
+    parameters = [pattern]
+    if xmlid:
+        query += " AND paragraphs.xmlid = ?"
+        parameters.append(xmlid)
+    query += " GROUP BY segments.id ORDER BY segments.id"
+    return conn.execute(query, parameters).fetchall()
+
+
+# ------------------------------------------------------------------------------
+def find_reading(conn: sqlite3.Connection, text: str, siglum: str = '') -> list:
+    """
+    Returns where a word or phrase is read (by a witness, if its
+    siglum is given), as tuples (siglum, xml:id, position, reading, pattern).
+    """
+    query = """
+        SELECT witnesses.siglum, paragraphs.xmlid, segments.position,
+               readings.reading, segments.pattern
+        FROM readings_fts
+        JOIN readings ON readings.id = readings_fts.rowid
+        JOIN witnesses ON witnesses.id = readings.witness
+        JOIN segments ON segments.id = readings.segment
+        JOIN paragraphs ON paragraphs.id = segments.paragraph
+        WHERE readings_fts MATCH ?"""
+    parameters = ['"' + text.replace('"', '""') + '"']
+    if siglum:
+        query += " AND witnesses.siglum = ?"
+        parameters.append(siglum)
+    query += " ORDER BY readings.id"
+    return conn.execute(query, parameters).fetchall()
@@ -0,0 +1,310 @@
+""" service.py
+Part of Witness Relationships v.0.1
+🄯 2022 Nicolas Vaughan
+n.vaughan@uniandes.edu.co
+Universidad de los Andes, Colombia
+Runs on Python 3.8+ """
+
+import os
+import json
+import threading
+from os import path
+from itertools import accumulate
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+try:
+    import defaults
+except ImportError:
+    raise ImportError("\n[!] defaults module not available.\nAborting...")
+
+try:
+    import getdata
+except ImportError:
+    raise ImportError("\n[!] getdata module not available.\nAborting...")
+
+try:
+    from witnesses import Witness
+except ImportError:
+    raise ImportError("\n[!] witnesses module not available.\nAborting...")
+
+try:
+    import createcollation
+except ImportError:
+    raise ImportError("\n[!] createcollation module not available.\nAborting...")
+
+try:
+    import prefilter
+except ImportError:
+    raise ImportError("\n[!] prefilter module not available.\nAborting...")
+
+try:
+    from patternindex import PatternIndex
+except ImportError:
+    raise ImportError("\n[!] patternindex module not available.\nAborting...")
+
+
+# ------------------------------------------------------------------------------
+
+
+class AnalysisService:
+    """ Keeps the parsed witnesses, the collation (paragraph by paragraph)
+    and the pattern index in memory. The data directory is polled
+    every defaults.watchinterval seconds, and only the paragraphs of
+    changed witnesses are collated again. Updates are serialised by
+    self.lock and swapped in at once when ready (self.current), so
+    queries never wait, nor see the old and the new collation mixed.
+    The collation is stored as "{prefix}_service_variants.json"
+    (and "_service_offsets.json"), so that the files of a batch run
+    are read but never overwritten. """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.filelist = getdata.get_input_data()
+        self.witnesses = [Witness(fname) for fname in self.filelist]
+        getdata.checkwitnesses(self.witnesses)
+        self.allxmlids = defaults.xmlids
+        self.mtimes = [self.mtime(w.file_name) for w in self.witnesses]
+        self.worker = createcollation.CollationWorker()
+        self.keep = []          # witness paragraphs in the collation
+        # (pattern index, segments of each paragraph, their offsets)
+        self.current = (None, [], [0])
+        self.load()
+
+    @staticmethod
+    def mtime(fname: str) -> float:
+        """ Returns the modification time of a file. """
+        return os.stat(fname).st_mtime
+
+    @staticmethod
+    def filenames(infix: str = '') -> tuple:
+        """ Returns the names of the variants and offsets files. """
+        fname = defaults.datadir + defaults.prefix + infix
+        return fname + '_variants.json', fname + '_offsets.json'
+
+    def check(self) -> list:
+        """ Checks the witnesses' paragraphs (see prefilter.check_paragraphs)
+        and returns the indices of those to be collated, leaving out
+        the flagged ones if defaults.excludeflagged. Sets defaults.xmlids
+        and defaults.parnum accordingly, as in a batch run. """
+        defaults.xmlids = self.allxmlids
+        defaults.parnum = len(self.allxmlids)
+        flagged = prefilter.check_paragraphs(self.witnesses)
+        keep = list(range(defaults.parnum))
+        if defaults.excludeflagged:
+            keep = prefilter.exclude_paragraphs(keep, flagged)
+        return keep
+
+    def load(self) -> None:
+        """ Reads the stored collation (the service's own, else the
+        batch run's) if it is up to date, otherwise collates
+        all paragraphs. """
+        self.keep = self.check()
+        newest = max(self.mtimes)
+        for fname, offsetsfname in (self.filenames('_service'), self.filenames()):
+            if not (path.exists(fname) and path.exists(offsetsfname)):
+                continue
+            if min(self.mtime(fname), self.mtime(offsetsfname)) < newest:
+                print(f"[!] {fname} is older than the witnesses. Ignoring...")
+                continue
+            fullcollation = createcollation.readcollationfile(fname)
+            createcollation.readoffsetsfile(offsetsfname)
+            if defaults.parxmlids == defaults.xmlids:
+                offsets = defaults.paroffsets
+                parsegments = [fullcollation[offsets[p]:offsets[p + 1]]
+                               for p in range(defaults.parnum)]
+                self.reindex(parsegments, save=False)
+                return
+        self.recollate(set())
+
+    def recollate(self, changed: set) -> None:
+        """ Checks the witnesses' paragraphs again, and collates
+        those (indices in the witnesses) whose text changed
+        and those not collated yet. """
+        index, parsegments, offsets = self.current
+        collated = {p: segments for p, segments in zip(self.keep, parsegments)
+                    if p not in changed}
+        self.keep = self.check()
+        missing = [p for p in self.keep if p not in collated]
+        print(f"Collating {len(missing)} paragraphs...")
+        for p in missing:
+            witsegs = [(w.id, w.paragraphs[p]) for w in self.witnesses]
+            collated[p] = self.worker.collate(witsegs, self.allxmlids[p])
+        self.reindex([collated[p] for p in self.keep])
+
+    def reindex(self, parsegments: list, save: bool = True) -> None:
+        """ Rebuilds the pattern index from the collation (a list of
+        the segments of each paragraph), swaps both in, and stores
+        the collation in the data directory. """
+        fullcollation = [seg for segments in parsegments for seg in segments]
+        defaults.parxmlids = defaults.xmlids
+        defaults.paroffsets = [0] + list(accumulate(len(s) for s in parsegments))
+        index = PatternIndex(fullcollation, defaults.paroffsets, defaults.parxmlids)
+        self.current = (index, parsegments, defaults.paroffsets)
+        if save:
+            fname, offsetsfname = self.filenames('_service')
+            createcollation.writecollationfile(fullcollation, fname)
+            createcollation.writeoffsetsfile(offsetsfname)
+
+    def reparse(self, i: int):
+        """ Parses again the i-th witness, and returns it
+        (None if its file cannot be read or parsed, or no longer
+        matches the other witnesses). defaults.sigla is kept as is. """
+        old = self.witnesses[i]
+        sigla = list(defaults.sigla)
+        try:
+            new = Witness(old.name)
+        except Exception as e:
+            print(f"[!] Error! {old.short_file_name} could not be parsed: {e}. Ignoring...")
+            return None
+        finally:
+            defaults.sigla = sigla
+        if new.xml_ids != self.allxmlids:
+            print(f"[!] Error! {new.name} no longer matches the other witnesses. Ignoring...")
+            return None
+        defaults.sigla[i] = new.id
+        return new
+
+    def refresh(self, full: bool = False) -> list:
+        """ Parses again the witnesses whose files changed
+        (all of them if full), and collates again the paragraphs
+        whose text changed. Returns the xml:ids of the changed paragraphs. """
+        changed = set()
+        for i, old in enumerate(self.witnesses):
+            try:
+                mtime = self.mtime(old.file_name)
+            except OSError as e:
+                print(f"[!] Error! {old.short_file_name} could not be read: {e}. Ignoring...")
+                continue
+            if not full and mtime == self.mtimes[i]:
+                continue
+            # a file which cannot be used is reported once, until it changes again
+            self.mtimes[i] = mtime
+            new = self.reparse(i)
+            if new is None:
+                continue
+            self.witnesses[i] = new
+            changed |= {p for p in range(len(self.allxmlids))
+                        if full or new.paragraphs[p] != old.paragraphs[p]}
+        if changed:
+            self.recollate(changed)
+        return [self.allxmlids[p] for p in sorted(changed)]
+
+    def watch(self) -> None:
+        """ Polls the data directory for changes until stopped. """
+        while not self.stopped.wait(defaults.watchinterval):
+            try:
+                with self.lock:
+                    self.refresh()
+            except Exception as e:
+                print(f"[!] Error! Could not update the collation: {e}")
+
+    # --------------------------------------------------------------------------
+    # queries; each one returns a json-serialisable object
+
+    def status(self, query: dict) -> dict:
+        index, parsegments, offsets = self.current
+        return {"prefix": defaults.prefix,
+                "witnesses": [w.name for w in self.witnesses],
+                "sigla": [w.id for w in self.witnesses],
+                "paragraphs": index.parnum,
+                "segments": offsets[-1]}
+
+    def percentages(self, query: dict) -> list:
+        first = int(query.get("first", 0))
+        last = int(query.get("last", 0))
+        return self.current[0].percentages(first, last)
+
+    def paragraph(self, query: dict) -> dict:
+        index, parsegments, offsets = self.current
+        if "xmlid" in query:
+            p = index.index_of(query["xmlid"])
+        else:
+            p = int(query["index"])
+        patterns = index.paragraph(p)
+        return {"index": p,
+                "xmlid": index.xmlids[p],
+                "patterns": patterns,
+                "segments": parsegments[p]}
+
+    def top(self, query: dict) -> list:
+        k = int(query.get("k", 20))
+        return self.current[0].top(query["pattern"], k)
+
+    def rerun(self, query: dict) -> dict:
+        full = query.get("full", "0") == "1"
+        return {"changed": self.refresh(full)}
+
+
+# ------------------------------------------------------------------------------
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """ Answers GET /status, /percentages, /paragraph and /top,
+    and POST /rerun, with json. """
+
+    service: AnalysisService
+    routes = {("GET", "/status"): AnalysisService.status,
+              ("GET", "/percentages"): AnalysisService.percentages,
+              ("GET", "/paragraph"): AnalysisService.paragraph,
+              ("GET", "/top"): AnalysisService.top,
+              ("POST", "/rerun"): AnalysisService.rerun}
+
+    def answer(self, method: str) -> None:
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        route = self.routes.get((method, url.path))
+        if route is None:
+            self.reply(404, {"error": f"Unknown request: {method} {url.path}"})
+            return
+        try:
+            if method == "POST":
+                with self.service.lock:
+                    result = route(self.service, query)
+            else:
+                result = route(self.service, query)
+        except (KeyError, ValueError, IndexError) as e:
+            self.reply(400, {"error": f"Bad request: {e}"})
+            return
+        self.reply(200, result)
+
+    def reply(self, code: int, result: any) -> None:
+        body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self.answer("GET")
+
+    def do_POST(self) -> None:
+        self.answer("POST")
+
+    def log_message(self, format, *args) -> None:
+        # keep the console quiet
+        return
+
+
+# ------------------------------------------------------------------------------
+def serve() -> None:
+    """ Runs the analysis service until interrupted. """
+    service = AnalysisService()
+    RequestHandler.service = service
+
+    watcher = threading.Thread(target=service.watch, daemon=True)
+    watcher.start()
+
+    server = ThreadingHTTPServer((defaults.serverhost, defaults.serverport), RequestHandler)
+    print(f"Serving on http://{defaults.serverhost}:{defaults.serverport}/ (Ctrl-C to stop)...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        service.stopped.set()
+        server.server_close()
+        service.worker.close()
+    return
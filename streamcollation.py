@@ -0,0 +1,94 @@
+""" streamcollation.py
+Part of Witness Relationships v.0.1
+🄯 2022 Nicolas Vaughan
+n.vaughan@uniandes.edu.co
+Universidad de los Andes, Colombia
+Runs on Python 3.8+ """
+
+import sys
+from collections import Counter
+from itertools import zip_longest
+
+try:
+    import defaults
+except ImportError:
+    raise ImportError("\n[!] defaults module not available.\nAborting...")
+
+try:
+    import getdata
+except ImportError:
+    raise ImportError("\n[!] getdata module not available.\nAborting...")
+
+try:
+    import prefilter
+except ImportError:
+    raise ImportError("\n[!] prefilter module not available.\nAborting...")
+
+try:
+    import processcollation
+except ImportError:
+    raise ImportError("\n[!] processcollation module not available.\nAborting...")
+
+try:
+    from createcollation import CollationWorker
+except ImportError:
+    raise ImportError("\n[!] createcollation module not available.\nAborting...")
+
+# progress bars
+try:
+    from tqdm import tqdm
+except ImportError:
+    raise ImportError("\n[!] tqdm module not available.\nAborting...")
+
+
+# ------------------------------------------------------------------------------
+def streamcollation(filelist: list) -> Counter:
+    """
+    Streams all witnesses in lockstep, paragraph by paragraph:
+    each tuple of parallel paragraphs is checked, collated and
+    classified, and then discarded.
+    Returns the No. of occurrences of each variation
+    (see processcollation.calculate_percentages_from_counts).
+    """
+    print(f'Streaming {defaults.witnum} files... ')
+
+    sigla = []
+    streams = []
+    for fname in filelist:
+        wit, paragraphs = getdata.stream_file(defaults.datadir + fname + '.xml')
+        defaults.sigla.append(wit)
+        sigla.append(wit)
+        streams.append(paragraphs)
+
+    worker = CollationWorker()
+    flagged = defaults.report.setdefault("flagged", [])
+    histogram = Counter()
+    parnum = 0
+
+    for row in tqdm(zip_longest(*streams)):
+        if None in row:
+            print('\nError! Files do not have the same number of <p xml:id="..."> tags!')
+            print('Aborting...')
+            worker.close()
+            sys.exit(1)
+
+        xmlids = [par[0] for par in row]
+        texts = [par[1] for par in row]
+
+        item = prefilter.check_row(parnum, xmlids, texts)
+        if item is not None:
+            flagged.append(item)
+            prefilter.warn(item)
+        parnum += 1
+        if item is not None and defaults.excludeflagged:
+            continue
+
+        segments = worker.collate(list(zip(sigla, texts)), xmlids[0])
+        histogram.update(processcollation.classify_variations(segments))
+
+    worker.close()
+
+    defaults.parnum = parnum
+    print(f"Number of total paragraphs: {defaults.parnum}")
+
+    return histogram
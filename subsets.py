@@ -0,0 +1,178 @@
+""" subsets.py
+Part of Witness Relationships v.0.1
+🄯 2022 Nicolas Vaughan
+n.vaughan@uniandes.edu.co
+Universidad de los Andes, Colombia
+Runs on Python 3.8+ """
+
+import json
+import operator
+from collections import Counter
+from functools import lru_cache
+from itertools import combinations
+
+try:
+    import defaults
+except ImportError:
+    raise ImportError("\n[!] defaults module not available.\nAborting...")
+
+try:
+    import processcollation
+except ImportError:
+    raise ImportError("\n[!] processcollation module not available.\nAborting...")
+
+
+# ------------------------------------------------------------------------------
+def count_codes(values: list) -> Counter:
+    """
+    Returns the No. of segments of each code (e.g. 'ABBD')
+    for all witnesses, given the classified segments (see
+    processcollation.classify_segments). Every subset is projected
+    from these (few) distinct codes rather than from the segments.
+    """
+    return Counter({processcollation.pattern_name(value): count
+                    for value, count in Counter(values).items()})
+
+
+# ------------------------------------------------------------------------------
+def count_readings(segmentlist: list) -> Counter:
+    """
+    Returns the No. of segments of each (distinct) tuple of readings.
+    In fuzzy mode (see processcollation.same_reading), subsets are
+    projected from these, since near-equality is not transitive:
+    e.g. 'abcd', 'abcx', 'abxx', 'zzzz' read 'AACD' at 0.25, but the
+    last three read 'AAC', not 'ABC'.
+    """
+    return Counter(tuple(segment) for segment in segmentlist)
+
+
+# ------------------------------------------------------------------------------
+def pick(counts: Counter, subset: tuple) -> Counter:
+    """
+    Returns the No. of segments of each key of counts (a code, or a tuple
+    of readings) once the columns of a subset of witnesses (given as
+    a tuple of their indices) are picked out of it.
+    """
+    columns = operator.itemgetter(*subset)
+    picked = Counter()
+    for key, count in counts.items():
+        picked[columns(key)] += count
+    return picked
+
+
+# ------------------------------------------------------------------------------
+def project(codecounts: Counter, subset: tuple) -> Counter:
+    """
+    Returns the No. of segments of each code for a subset of
+    witnesses (given as a tuple of their indices), e.g. 'ABBD' becomes
+    'ABB' for (0, 1, 2) and 'ABC' for (0, 2, 3).
+    """
+    # a code's letters identify each witness' group of readings,
+    # so that the columns of the subset are just picked out...
+    picked = pick(codecounts, subset)
+
+    # ...and each distinct pick is lettered again
+    subsetcounts = Counter()
+    for letters, count in picked.items():
+        subsetcounts[recode(letters)] += count
+    return subsetcounts
+
+
+# ------------------------------------------------------------------------------
+def classify_readings(readingcounts: Counter) -> Counter:
+    """ Returns the No. of segments of each code, given
+    the No. of segments of each tuple of readings. """
+    codecounts = Counter()
+    for readings, count in readingcounts.items():
+        codecounts[processcollation.pattern_code(readings)] += count
+    return codecounts
+
+
+# ------------------------------------------------------------------------------
+@lru_cache(maxsize=2 ** 16)
+def recode(letters: tuple) -> str:
+    """ Letters a projected code again (see processcollation.pattern_code),
+    e.g. ('B', 'D', 'B') becomes 'ABA'. """
+    first = {}
+    return "".join(first.setdefault(letter, chr(65 + i))
+                   for i, letter in enumerate(letters))
+
+
+# ------------------------------------------------------------------------------
+def all_subsets(size: int = 0) -> list:
+    """
+    Returns all subsets of witnesses of a given size
+    (of every size from 3 to witnum if size == 0).
+    Pairs are left out, since they can only read 'AB'
+    (once agreements are pruned).
+    """
+    if 0 < size < 3:
+        print(f"[!] Subsets of {size} witnesses have no variant patterns to compare. Skipping...")
+        return []
+    sizes = [size] if size else range(3, defaults.witnum + 1)
+    return [subset for k in sizes
+            for subset in combinations(range(defaults.witnum), k)]
+
+
+# ------------------------------------------------------------------------------
+def leave_one_out() -> list:
+    """ Returns the subsets of witnesses leaving each one out in turn. """
+    return all_subsets(defaults.witnum - 1)[::-1]
+
+
+# ------------------------------------------------------------------------------
+def project_all(codecounts: Counter, subsets: list, projection=project) -> dict:
+    """
+    Returns the code counts of each subset of witnesses
+    (or, with projection=pick, their counts of tuples of readings).
+    Each subset is projected from a subset with one more witness
+    (which has fewer distinct codes than the full set), down from
+    the full set, so that shared supersets are projected only once.
+    """
+    everyone = tuple(range(defaults.witnum))
+    projections = {everyone: codecounts}
+
+    def counts_of(subset: tuple) -> Counter:
+        if subset not in projections:
+            missing = next(i for i in everyone if i not in subset)
+            parent = tuple(sorted(subset + (missing,)))
+            columns = tuple(parent.index(i) for i in subset)
+            projections[subset] = projection(counts_of(parent), columns)
+        return projections[subset]
+
+    return {subset: counts_of(subset) for subset in subsets}
+
+
+# ------------------------------------------------------------------------------
+def analyse_subsets(segmentlist: list, subsets: list, values: list = None) -> dict:
+    """
+    Returns the percentages (see processcollation.calculate_percentages)
+    of each subset of witnesses, keyed by their sigla, e.g. "#M #S #V".
+    values are the segments already classified, if known.
+    """
+    print(f"Analysing {len(subsets)} subsets of witnesses...")
+    if defaults.fuzzythreshold:
+        projections = project_all(count_readings(segmentlist), subsets, pick)
+        projections = {subset: classify_readings(readingcounts)
+                       for subset, readingcounts in projections.items()}
+    else:
+        if values is None:
+            values = processcollation.classify_segments(segmentlist)
+        projections = project_all(count_codes(values), subsets)
+    results = {}
+    for subset, subsetcounts in projections.items():
+        name = " ".join(defaults.sigla[i] for i in subset)
+        results[name] = processcollation.calculate_code_percentages(subsetcounts)
+    return results
+
+
+# ------------------------------------------------------------------------------
+def writesubsetsfile(results: dict) -> None:
+    """ Prints the results and writes them as "{prefix}_subsets.json". """
+    for name, percentlist in results.items():
+        line = ", ".join(f"{item[0]}: {item[1]}%" for item in percentlist)
+        print(f"{name} -- {line}")
+    fname = defaults.datadir + defaults.prefix + "_subsets.json"
+    with open(fname, "w") as outfile:
+        json.dump(results, outfile, indent=2)
+    return
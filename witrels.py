@@ -9,6 +9,7 @@ Runs on Python 3.8+ """
 
 import sys
 import json
+import argparse
 from os import path
 
 try:
@@ -41,6 +42,46 @@ try:
 except ImportError:
     raise ImportError("\n[!] createcollation module not available.\nAborting...")
 
+try:
+    import prefilter
+except ImportError:
+    raise ImportError("\n[!] prefilter module not available.\nAborting...")
+
+try:
+    import service
+except ImportError:
+    raise ImportError("\n[!] service module not available.\nAborting...")
+
+try:
+    import streamcollation
+except ImportError:
+    raise ImportError("\n[!] streamcollation module not available.\nAborting...")
+
+try:
+    import subsets
+except ImportError:
+    raise ImportError("\n[!] subsets module not available.\nAborting...")
+
+try:
+    import profiles
+except ImportError:
+    raise ImportError("\n[!] profiles module not available.\nAborting...")
+
+try:
+    import resultstore
+except ImportError:
+    raise ImportError("\n[!] resultstore module not available.\nAborting...")
+
+try:
+    import addwitness
+except ImportError:
+    raise ImportError("\n[!] addwitness module not available.\nAborting...")
+
+try:
+    import heatmap
+except ImportError:
+    raise ImportError("\n[!] heatmap module not available.\nAborting...")
+
 
 # ----------------------------------------------------
 # ----------------------------------------------------
@@ -59,6 +100,18 @@ def read_config_file() -> None:
         defaults.tempdatadir = conf["tempdatadir"]
         defaults.resultfile = conf["resultfile"]
         defaults.plotresults = conf["plotresults"]
+        defaults.reportfile = conf["reportfile"]
+        defaults.collationtimeout = conf["collationtimeout"]
+        defaults.collationmaxmemory = conf["collationmaxmemory"]
+        defaults.similaritythreshold = conf["similaritythreshold"]
+        defaults.excludeflagged = conf["excludeflagged"]
+        defaults.serverhost = conf["serverhost"]
+        defaults.serverport = conf["serverport"]
+        defaults.watchinterval = conf["watchinterval"]
+        defaults.fuzzythreshold = conf["fuzzythreshold"]
+        defaults.storeresults = conf["storeresults"]
+        defaults.heatmap = conf["heatmap"]
+        defaults.heatmapbins = conf["heatmapbins"]
 
     datafilename = defaults.datafilename
     if not path.exists(datafilename):
@@ -76,14 +129,8 @@ def read_config_file() -> None:
 
 
 # -----------------------------------------------------
-def main() -> None:
-    """ Main function. """
-    # read configfile and set global variables in defaults.py
-    read_config_file()
-
-    # Create a list of xml files from the data dir
-    filelist = getdata.get_input_data()
-
+def collate_witnesses(filelist: list) -> list:
+    """ Parses and collates all witnesses. """
     print(f'Parsing {defaults.witnum} files... ')
 
     # Creates a lists of Witness objects.
@@ -93,6 +140,9 @@ def main() -> None:
 
     getdata.checkwitnesses(witnesslist)
 
+    # flag paragraphs which look misaligned across witnesses
+    flagged = prefilter.check_paragraphs(witnesslist)
+
     # "data" is a list which contains, in each entry, a list of tuples.
     # Each tuple is composed of a witness id (e.g. '#M') and a string
     # containing the text of the correspoding <p> element.
@@ -104,6 +154,9 @@ def main() -> None:
     # [[["#M", "tertiodecimo..." ], ...], ...]
     data = createcollation.prepare_collation(witnesslist)
 
+    if defaults.excludeflagged:
+        data = prefilter.exclude_paragraphs(data, flagged)
+
     # save "data" as "{prefix}_data.json"
     createcollation.writedatafile(data)
 
@@ -114,16 +167,121 @@ def main() -> None:
     # collist = createcollation.createcollation(data=data, firstline=0, lastline=0)
     collist = createcollation.createcollation(data, firstline=0, lastline=0)
 
+    return collist
+
+
+# -----------------------------------------------------
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Witness Relationships")
+    parser.add_argument("--serve", action="store_true",
+                        help="keep witnesses and collation in memory and "
+                             "answer queries over a local HTTP/JSON API")
+    parser.add_argument("--stream", action="store_true",
+                        help="stream the witnesses paragraph by paragraph, "
+                             "keeping memory bounded (no collation file is written)")
+    parser.add_argument("--subsets", type=int, nargs="?", const=0, metavar="K",
+                        help="also analyse every subset of K witnesses "
+                             "(of every size from 3 if K is omitted)")
+    parser.add_argument("--leave-one-out", action="store_true",
+                        help="also analyse the witnesses leaving each one out in turn")
+    parser.add_argument("--profiles", nargs="*", metavar="PROFILE",
+                        help="also classify the variations under these orthographic "
+                             "normalisation profiles (all of them if none is given): "
+                             + ", ".join(profiles.profiles))
+    parser.add_argument("--add-witness", metavar="NAME",
+                        help="extend the stored collation with a new witness "
+                             "(NAME.xml in the data directory) without collating "
+                             "the other witnesses again")
+    args = parser.parse_args()
+
+    # the streaming mode keeps no collation to analyse further
+    if args.stream:
+        ignored = [flag for flag, given in (("--subsets", args.subsets is not None),
+                                            ("--leave-one-out", args.leave_one_out),
+                                            ("--profiles", args.profiles is not None),
+                                            ("--add-witness", args.add_witness))
+                   if given]
+        if ignored:
+            parser.error(f"--stream cannot be combined with {', '.join(ignored)}")
+    return args
+
+
+# -----------------------------------------------------
+def main() -> None:
+    """ Main function. """
+    args = parse_arguments()
+
+    # read configfile and set global variables in defaults.py
+    read_config_file()
+
+    if args.serve:
+        service.serve()
+        return
+
+    # Create a list of xml files from the data dir
+    filelist = getdata.get_input_data()
+
+    if args.stream:
+        skipped = [name for name, enabled in (("storeresults", defaults.storeresults),
+                                              ("heatmap", defaults.heatmap))
+                   if enabled]
+        if skipped:
+            print(f"[!] No collation is kept in streaming mode. "
+                  f"Skipping {' and '.join(skipped)}...")
+        histogram = streamcollation.streamcollation(filelist)
+        percentlist = processcollation.calculate_percentages_from_counts(histogram)
+        processcollation.generate_plot(percentlist)
+        createcollation.writereportfile()
+        print("Finished!")
+        return
+
+    if args.add_witness:
+        # extend the stored collation with a new witness
+        collist = addwitness.addwitness(filelist, args.add_witness)
+    else:
+        collist = collate_witnesses(filelist)
+
     print("Collation ready.")
 
-    variationlist = processcollation.classify_variations(collist)
+    # classify every segment once (only fuzzy subsets and normalisation
+    # profiles other than raw classify their own readings again)
+    values = processcollation.classify_segments(collist)
+
+    # bin and render the heatmap off the critical path
+    heatmapworker = heatmap.start_heatmap(collist, values) if defaults.heatmap else None
+
+    # prune "0" freqs
+    variationlist = [value for value in values if value != 0]
 
     percentlist = processcollation.calculate_percentages(variationlist)
 
     processcollation.generate_plot(percentlist)
 
+    # save every segment, with its paragraph and readings, to sqlite
+    if defaults.storeresults:
+        resultstore.writeresultstore(collist, filelist, values)
+
+    # analyse subsets of witnesses from the same collation
+    subsetlist = []
+    if args.subsets is not None:
+        subsetlist += subsets.all_subsets(args.subsets)
+    if args.leave_one_out:
+        subsetlist += subsets.leave_one_out()
+    if subsetlist:
+        subsets.writesubsetsfile(subsets.analyse_subsets(collist, subsetlist, values))
+
+    # compare normalisation profiles on the same collation
+    if args.profiles is not None:
+        names = args.profiles or list(profiles.profiles)
+        profiles.writeprofilesfile(profiles.profile_percentages(collist, names, percentlist))
+
     # processcollation.interpret_results(percentlist)
 
+    createcollation.writereportfile()
+
+    if heatmapworker is not None:
+        heatmapworker.join()
+
     print("Finished!")
 
     return